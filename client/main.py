@@ -27,7 +27,7 @@ if sys.platform == "win32":
 # sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from network import STUNClient
-from tcp_handler import TCPServer
+from tcp_handler import TCPServer, FrameReader, encode_frame, recv_line
 from file_transfer import FileTransfer
 
 # Initialize colorama for colored output
@@ -153,7 +153,7 @@ Type {Fore.GREEN}help{Style.RESET_ALL} or {Fore.GREEN}?{Style.RESET_ALL} to list
                     "status": "accepted",
                     "message": f"Connection accepted by {self.username}"
                 }
-                peer_socket.send(json.dumps(response_msg).encode('utf-8'))
+                peer_socket.sendall(json.dumps(response_msg).encode('utf-8') + b'\n')
                 
                 # Create and store peer connection
                 connected_peer = ConnectedPeer(
@@ -166,7 +166,7 @@ Type {Fore.GREEN}help{Style.RESET_ALL} or {Fore.GREEN}?{Style.RESET_ALL} to list
                 self.peers[peer_username] = connected_peer
                 
                 # Start listening for messages from this peer
-                self.start_peer_listener(peer_username, peer_socket)
+                self.start_peer_listener(peer_username, peer_socket, peer_info.get('pending', b''))
                 
                 print(f"{Fore.GREEN}✅ Connected to {peer_username}{Style.RESET_ALL}")
                 print(f"{Fore.YELLOW}Type 'chat {peer_username}' to start chatting{Style.RESET_ALL}")
@@ -179,42 +179,56 @@ Type {Fore.GREEN}help{Style.RESET_ALL} or {Fore.GREEN}?{Style.RESET_ALL} to list
                     "status": "rejected",
                     "message": "Connection rejected"
                 }
-                peer_socket.send(json.dumps(response_msg).encode('utf-8'))
+                peer_socket.sendall(json.dumps(response_msg).encode('utf-8') + b'\n')
                 peer_socket.close()
                 print(f"{Fore.RED}❌ Connection rejected{Style.RESET_ALL}")
                 break
     
-    def start_peer_listener(self, peer_username: str, peer_socket: socket.socket):
+    def start_peer_listener(self, peer_username: str, peer_socket: socket.socket, pending: bytes = b''):
         """Start a thread to listen for messages from a peer"""
         listener_thread = threading.Thread(
             target=self.listen_to_peer,
-            args=(peer_socket, peer_username),
+            args=(peer_socket, peer_username, pending),
             daemon=True
         )
         self.listener_threads[peer_username] = listener_thread
         listener_thread.start()
     
-    def listen_to_peer(self, sock: socket.socket, peer_username: str):
+    def listen_to_peer(self, sock: socket.socket, peer_username: str, pending: bytes = b''):
         """Listen for messages from a connected peer"""
+        # Bytes read past the handshake line are the start of the framed stream
+        reader = FrameReader(initial=pending)
+        
+        # Set timeout to allow checking for running flag
+        sock.settimeout(1.0)
+        
+        data = b''  # first pass only drains frames already held by the reader
         while self.running and peer_username in self.peers:
             try:
-                # Set timeout to allow checking for running flag
-                sock.settimeout(1.0)
+                try:
+                    frames = reader.feed(data)
+                except ValueError as e:
+                    # Oversized frame header: the peer is not speaking the framed protocol
+                    logger.warning(f"Dropping {peer_username}: {e}")
+                    break
+                
+                # Parse and handle every complete message
+                for frame in frames:
+                    try:
+                        message = json.loads(frame)
+                    except json.JSONDecodeError:
+                        # Handle non-JSON data (could be binary file data)
+                        self.handle_binary_data(frame, peer_username)
+                        continue
+                    self.handle_peer_message(message, peer_username)
                 
-                # Receive data
+                # Receive data; one recv may carry several frames
                 data = sock.recv(65536)
                 if not data:
                     break
                 
-                # Parse and handle message
-                try:
-                    message = json.loads(data.decode('utf-8'))
-                    self.handle_peer_message(message, peer_username)
-                except json.JSONDecodeError:
-                    # Handle non-JSON data (could be binary file data)
-                    self.handle_binary_data(data, peer_username)
-                
             except socket.timeout:
+                data = b''
                 continue
             except (ConnectionResetError, ConnectionAbortedError):
                 break
@@ -521,16 +535,17 @@ Type {Fore.GREEN}help{Style.RESET_ALL} or {Fore.GREEN}?{Style.RESET_ALL} to list
                 "username": self.username,
                 "timestamp": time.time()
             }
-            sock.send(json.dumps(request).encode('utf-8'))
+            sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
             
-            # Wait for response
-            response_data = sock.recv(1024)
-            if not response_data:
+            # Wait for response line; anything read after it is already framed
+            # and is handed to the peer listener
+            response_data, pending = recv_line(sock)
+            if not response_data.endswith(b'\n'):
                 print(f"{Fore.RED}No response from {arg}{Style.RESET_ALL}")
                 sock.close()
                 return
             
-            response = json.loads(response_data.decode('utf-8'))
+            response = json.loads(response_data)
             
             if response.get('status') == 'accepted':
                 # Store connection
@@ -544,7 +559,7 @@ Type {Fore.GREEN}help{Style.RESET_ALL} or {Fore.GREEN}?{Style.RESET_ALL} to list
                 self.peers[arg] = connected_peer
                 
                 # Start listener thread
-                self.start_peer_listener(arg, sock)
+                self.start_peer_listener(arg, sock, pending)
                 
                 print(f"{Fore.GREEN}✅ Successfully connected to {arg}{Style.RESET_ALL}")
                 print(f"{Fore.YELLOW}Type 'chat {arg}' to start chatting{Style.RESET_ALL}")
@@ -887,7 +902,7 @@ Type {Fore.GREEN}help{Style.RESET_ALL} or {Fore.GREEN}?{Style.RESET_ALL} to list
         peer = self.peers[peer_username]
         try:
             data = json.dumps(message).encode('utf-8')
-            peer.socket.sendall(data)
+            peer.socket.sendall(encode_frame(data))
             return True
         except Exception as e:
             logger.error(f"Failed to send to {peer_username}: {e}")
@@ -2,11 +2,78 @@ import socket
 import threading
 import json
 import logging
-from typing import Dict, Callable, Optional, Any
+from typing import Dict, List, Callable, Optional, Any, Tuple
 from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
 
+# Handshakes are a single JSON object terminated by a newline
+HANDSHAKE_MAX_SIZE = 4096
+
+# Peer messages are framed with a 4-byte big-endian length prefix
+FRAME_HEADER_SIZE = 4
+# Largest frame a peer may announce; messages and 4KB file chunks stay far below
+MAX_FRAME_SIZE = 1024 * 1024
+
+
+def recv_line(sock: socket.socket) -> Tuple[bytes, bytes]:
+    """
+    Read one newline-terminated handshake line
+    Returns: (line, rest) - line ends with b'\n' unless the peer closed or sent
+             too much; rest holds bytes received after it (start of the framed stream)
+    """
+    buf = bytearray()
+    while True:
+        end = buf.find(b'\n', 0, HANDSHAKE_MAX_SIZE)
+        if end >= 0:
+            return bytes(buf[:end + 1]), bytes(buf[end + 1:])
+        if len(buf) >= HANDSHAKE_MAX_SIZE:
+            break
+        data = sock.recv(4096)
+        if not data:
+            break
+        buf.extend(data)
+    return bytes(buf), b''
+
+
+def encode_frame(payload: bytes) -> bytes:
+    """Prefix payload with its length for the peer message stream"""
+    return len(payload).to_bytes(FRAME_HEADER_SIZE, 'big') + payload
+
+
+class FrameReader:
+    """Accumulates received bytes and splits them into length-prefixed frames"""
+    
+    def __init__(self, initial: bytes = b''):
+        self.buffer = bytearray(initial)
+    
+    def feed(self, data: bytes) -> List[bytes]:
+        """
+        Append received data and extract every complete frame
+        Returns: List of frame payloads (empty if no frame is complete yet)
+        Raises: ValueError if a header exceeds MAX_FRAME_SIZE (e.g. unframed data)
+        """
+        buf = self.buffer
+        buf.extend(data)
+        
+        frames = []
+        offset = 0
+        while len(buf) - offset >= FRAME_HEADER_SIZE:
+            start = offset + FRAME_HEADER_SIZE
+            length = int.from_bytes(buf[offset:start], 'big')
+            if length > MAX_FRAME_SIZE:
+                raise ValueError(f"Frame of {length} bytes exceeds {MAX_FRAME_SIZE}")
+            end = start + length
+            if len(buf) < end:
+                break
+            frames.append(bytes(buf[start:end]))
+            offset = end
+        
+        # Drop consumed bytes in one shift instead of once per frame
+        if offset:
+            del buf[:offset]
+        return frames
+
 
 @dataclass
 class ConnectionInfo:
@@ -79,9 +146,13 @@ class TCPServer:
             # Set timeout for handshake
             client_socket.settimeout(10)
             
-            # Receive handshake data
-            handshake_data = client_socket.recv(1024).decode('utf-8')
-            handshake = json.loads(handshake_data)
+            # Receive handshake line ({json}\n)
+            handshake_line, pending = recv_line(client_socket)
+            if not handshake_line.endswith(b'\n'):
+                logger.warning(f"Incomplete handshake from {client_address}")
+                client_socket.close()
+                return
+            handshake = json.loads(handshake_line)
             
             if handshake.get('type') == 'connection_request':
                 username = handshake.get('username', f'unknown_{client_address[1]}')
@@ -97,7 +168,8 @@ class TCPServer:
                 peer_info = {
                     'username': username,
                     'socket': client_socket,
-                    'address': client_address
+                    'address': client_address,
+                    'pending': pending  # framed bytes that arrived with the handshake
                 }
                 
                 # Call the callback to handle connection request
@@ -111,7 +183,7 @@ class TCPServer:
                         "status": "rejected",
                         "message": "No handler available"
                     }
-                    client_socket.send(json.dumps(response).encode('utf-8'))
+                    client_socket.sendall(json.dumps(response).encode('utf-8') + b'\n')
                     client_socket.close()
                     
             else:
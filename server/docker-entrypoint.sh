@@ -16,4 +16,4 @@ echo "✅ Redis is ready!"
 
 # Start FastAPI server
 echo "Starting FastAPI server on port 8000..."
-exec uvicorn main:app --host 0.0.0.0 --port 8000
\ No newline at end of file
+exec uvicorn main:app --host 0.0.0.0 --port 8000 --loop uvloop --http httptools
\ No newline at end of file
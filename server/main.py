@@ -1,4 +1,5 @@
 from fastapi import FastAPI, HTTPException, status
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Dict
 import redis
@@ -50,6 +51,10 @@ class PeerList(BaseModel):
     peers: List[str]
     count: int
 
+class PeerInfoList(BaseModel):
+    peers: List[PeerInfo]
+    count: int
+
 # Helper functions
 def get_storage():
     """Get storage handler (Redis or in-memory)"""
@@ -76,6 +81,18 @@ def save_peer_memory(peer: PeerRegistration):
         "last_seen": datetime.now().isoformat()
     }
 
+def remove_peer_redis(username: str):
+    """Remove peer from Redis; returns whether it was registered"""
+    pipe = redis_client.pipeline()
+    pipe.srem("all_peers", username)
+    pipe.delete(f"peer:{username}")
+    removed, _ = pipe.execute()
+    return bool(removed)
+
+def remove_peer_memory(username: str):
+    """Remove peer from memory; returns whether it was registered"""
+    return peers_storage.pop(username, None) is not None
+
 def get_all_peers_redis():
     """Get all peers from Redis"""
     return list(redis_client.smembers("all_peers"))
@@ -108,6 +125,28 @@ def get_peer_info_memory(username: str):
         "last_seen": data["last_seen"]
     }
 
+def get_all_peer_infos_redis():
+    """Get info for all peers from Redis in a single pipeline round-trip"""
+    usernames = get_all_peers_redis()
+    pipe = redis_client.pipeline()
+    for username in usernames:
+        pipe.hgetall(f"peer:{username}")
+    
+    peer_infos = []
+    for username, data in zip(usernames, pipe.execute()):
+        if data:
+            peer_infos.append({
+                "username": username,
+                "ip_address": data["ip_address"],
+                "port": int(data["port"]),
+                "last_seen": data["last_seen"]
+            })
+    return peer_infos
+
+def get_all_peer_infos_memory():
+    """Get info for all peers from memory"""
+    return [get_peer_info_memory(username) for username in list(peers_storage)]
+
 # API Endpoints
 @app.post("/register", status_code=status.HTTP_201_CREATED)
 async def register_peer(peer: PeerRegistration):
@@ -146,7 +185,8 @@ async def register_peer(peer: PeerRegistration):
         }
     }
 
-@app.get("/peers", response_model=PeerList)
+# Read endpoints return pre-built dicts directly; the models only document the schema
+@app.get("/peers", responses={200: {"model": PeerList}})
 async def get_all_peers():
     """
     Get list of all registered peers
@@ -156,12 +196,27 @@ async def get_all_peers():
     else:
         peers = get_all_peers_memory()
     
-    return {
+    return ORJSONResponse({
         "peers": peers,
         "count": len(peers)
-    }
+    })
+
+@app.get("/peers_full", responses={200: {"model": PeerInfoList}})
+async def get_all_peers_full():
+    """
+    Get detailed information about all registered peers in one request
+    """
+    if redis_client:
+        peer_infos = get_all_peer_infos_redis()
+    else:
+        peer_infos = get_all_peer_infos_memory()
+    
+    return ORJSONResponse({
+        "peers": peer_infos,
+        "count": len(peer_infos)
+    })
 
-@app.get("/peerinfo/{username}", response_model=PeerInfo)
+@app.get("/peerinfo/{username}", responses={200: {"model": PeerInfo}})
 async def get_peer_info(username: str):
     """
     Get detailed information about a specific peer
@@ -177,7 +232,25 @@ async def get_peer_info(username: str):
             detail=f"Peer '{username}' not found"
         )
     
-    return peer_info
+    return ORJSONResponse(peer_info)
+
+@app.delete("/unregister/{username}")
+async def unregister_peer(username: str):
+    """
+    Remove a peer from the STUN server
+    """
+    if redis_client:
+        removed = remove_peer_redis(username)
+    else:
+        removed = remove_peer_memory(username)
+    
+    if not removed:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Peer '{username}' not found"
+        )
+    
+    return {"message": f"Peer '{username}' unregistered"}
 
 @app.get("/health")
 async def health_check():
@@ -199,6 +272,8 @@ if __name__ == "__main__":
         "main:app",
         host="0.0.0.0",
         port=8000,
+        loop="uvloop",
+        http="httptools",
         reload=True,
         log_level="info"
     )
\ No newline at end of file
@@ -3,14 +3,26 @@ P2P Web Backend - Flask Application with WebSocket Support
 This backend bridges the web interface with the P2P core.
 """
 
+# Patch blocking stdlib I/O before anything else imports it, so outbound
+# HTTP calls yield to the gevent hub instead of stalling every socket
+from gevent import monkey
+monkey.patch_all()
+
+import gevent
+from gevent.pool import Pool
+
+import itertools
 import json
 import logging
 import threading
 import time
-from flask import Flask, render_template, request, jsonify
+import orjson
+from flask import Flask, Response, render_template, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
-import requests
+import urllib3
+from urllib3.util.retry import Retry
 import subprocess
 import sys
 import os
@@ -21,174 +33,462 @@ sys.path.append('../../client')
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
 STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DEBUG = os.getenv('FLASK_DEBUG', '').lower() in ('1', 'true')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+class OrjsonModule:
+    """json-module stand-in backed by orjson, for python-socketio/engineio"""
+    
+    @staticmethod
+    def dumps(obj, **kwargs):
+        return orjson.dumps(obj).decode('utf-8')
+    
+    @staticmethod
+    def loads(s, **kwargs):
+        return orjson.loads(s)
 
-print(f"BASE_DIR: {BASE_DIR}")
-print(f"TEMPLATE_DIR: {TEMPLATE_DIR}")
-print(f"STATIC_DIR: {STATIC_DIR}")
 
 app = Flask(__name__, 
             template_folder=TEMPLATE_DIR,
             static_folder=STATIC_DIR,
             static_url_path='/static')
+app.json = OrjsonProvider(app)
 
 CORS(app, resources={r"/*": {"origins": "*"}})
 app.config['SECRET_KEY'] = 'p2p-secret-key-2024'
-app.config['DEBUG'] = True
+app.config['DEBUG'] = DEBUG
 
+# Single process, so no message_queue is configured. Bridge emits go
+# through _emit_local (ignore_queue=True); if message_queue='redis://...'
+# is ever added here, same-worker traffic still skips the broker
 socketio = SocketIO(
     app, 
     cors_allowed_origins="*",
-    async_mode='eventlet',
-    ping_timeout=60,
+    async_mode='gevent',  # pinned: greenlets, not one OS thread per client
+    transports=['websocket'],  # no long-polling fallback
+    serializer='msgpack',  # binary MessagePack packets instead of JSON text
+    json=OrjsonModule,  # remaining JSON (engine.io handshake) via orjson, even outside app context
+    ping_timeout=20,
     ping_interval=25,
-    logger=True,
-    engineio_logger=True, 
+    logger=False,  # per-packet logging is too costly on the emit path
+    engineio_logger=False,
     always_connect=True
 )
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG) 
+# Verbose logging is opt-in: P2P_DEBUG enables INFO, FLASK_DEBUG enables DEBUG
+if DEBUG:
+    LOG_LEVEL = logging.DEBUG
+elif os.getenv('P2P_DEBUG'):
+    LOG_LEVEL = logging.INFO
+else:
+    LOG_LEVEL = logging.WARNING
+logging.basicConfig(level=LOG_LEVEL)
 logger = logging.getLogger(__name__)
+logger.debug("BASE_DIR: %s, TEMPLATE_DIR: %s, STATIC_DIR: %s", BASE_DIR, TEMPLATE_DIR, STATIC_DIR)
 
 # Configuration
 STUN_SERVER_URL = os.getenv('STUN_SERVER_URL', 'http://stun-server:8000')
+# STUN endpoint urls, built once; per-peer ones are completed by concatenation
+_STUN_REGISTER = f"{STUN_SERVER_URL}/register"
+_STUN_PEERS = f"{STUN_SERVER_URL}/peers"
+_STUN_PEERS_FULL = f"{STUN_SERVER_URL}/peers_full"
+_STUN_PEERINFO = f"{STUN_SERVER_URL}/peerinfo/"
+_STUN_UNREG = f"{STUN_SERVER_URL}/unregister/"
 P2P_CORE_PATH = '../../client/main.py'
+PEER_INFO_WORKERS = 32  # concurrent /peerinfo greenlets
+STUN_CONNECT_TIMEOUT = float(os.getenv('STUN_CONNECT_TIMEOUT', '0.2'))
+STUN_HTTP_TIMEOUT = float(os.getenv('STUN_HTTP_TIMEOUT', '0.5'))
+STUN_TIMEOUT = urllib3.Timeout(connect=STUN_CONNECT_TIMEOUT, read=STUN_HTTP_TIMEOUT)
+PEER_INFO_DEADLINE = float(os.getenv('PEER_INFO_DEADLINE', '0.5'))  # seconds for the whole fan-out
+PEERS_CACHE_TTL = 2.0  # seconds, for /peers and /peers_full
+PEER_INFO_CACHE_TTL = 10.0  # seconds, for /peerinfo/<peer>
+STUN_CACHE_SWEEP_SIZE = 1024  # entries before expired ones are swept
+GET_PEERS_MIN_INTERVAL = 0.5  # seconds between peers-list rebuilds per socket
+FILE_CHUNK_SIZE = 64 * 1024  # larger files are streamed as file_chunk events
+PEERS_POLL_INTERVAL = 2.0  # seconds between background STUN peer refreshes
+PEERS_POLL_MAX_FAILURES = 3  # failed polls in a row before known_peers is dropped
+
+# Shared keep-alive connection pool for every STUN call; urllib3 is used
+# directly to skip the requests session/adapter machinery on each call.
+# No retries: within the sub-second STUN budget a retry only doubles tail latency
+_stun = urllib3.PoolManager(
+    num_pools=16,
+    maxsize=64,
+    retries=Retry(total=0, redirect=False),
+    headers={'Connection': 'keep-alive'}
+)
+
+# File ids: process start time plus a counter, unique without a clock read per file
+_boot = int(time.time())
+_file_ctr = itertools.count()
+
+# Short-lived cache of STUN GET responses: url -> (expires_at, data)
+_stun_cache = {}
+_stun_cache_lock = threading.Lock()
+
+
+def cached_get(url, ttl=PEERS_CACHE_TTL):
+    """
+    GET a JSON resource from STUN server, reusing responses younger than ttl
+    Returns: Decoded body, or None if the status is not 200
+    """
+    now = time.monotonic()
+    with _stun_cache_lock:
+        entry = _stun_cache.get(url)
+    if entry and entry[0] > now:
+        return entry[1]
+    
+    response = _stun.request('GET', url, timeout=STUN_TIMEOUT)
+    data = orjson.loads(response.data) if response.status == 200 else None
+    with _stun_cache_lock:
+        if len(_stun_cache) >= STUN_CACHE_SWEEP_SIZE:
+            # Per-peer urls would otherwise accumulate for peers that left
+            for key in [key for key, (expires_at, _) in _stun_cache.items() if expires_at <= now]:
+                del _stun_cache[key]
+        _stun_cache[url] = (now + ttl, data)
+    return data
+
+
+def invalidate_cached(*urls):
+    """Drop cached STUN responses for the given urls"""
+    with _stun_cache_lock:
+        for url in urls:
+            _stun_cache.pop(url, None)
+
+
+def _emit_local(event, data, to, **kwargs):
+    """
+    Emit to clients of this process without going through a message queue
+    The bridge state is per process, so every user it knows is connected here
+    """
+    socketio.emit(event, data, to=to, ignore_queue=True, **kwargs)
+
+
+def user_room(username):
+    """Personal Socket.IO room joined by each registered user"""
+    return f"user:{username}"
+
+
+# Socket.IO room every registered user joins, for presence broadcasts
+PRESENCE_ROOM = "presence"
+
+
+def web_peer_entry(username):
+    """Build the peers-list entry for a web user"""
+    return {
+        'username': username,
+        'ip_address': 'web-interface',
+        'port': 'N/A',
+        'type': 'web'  # Web peer
+    }
+
 
 class P2PWebBridge:
     """Bridge between web interface and P2P core"""
     
     def __init__(self):
         self.active_users = {}  # username -> socket_id
-        self.user_peers = {}    # username -> list of connected peers
+        self.sid_to_user = {}   # socket_id -> username
+        self.user_peers = {}    # username -> set of connected peers
+        self.web_peer_entries = {}  # username -> prebuilt peers-list entry
         self.p2p_processes = {} # username -> subprocess
         
+        # Guards check-then-mutate sequences on the dicts above; never held across I/O
+        self._lock = threading.RLock()
+        
+        # Greenlet pool for STUN lookups
+        self._peer_pool = Pool(size=PEER_INFO_WORKERS)
+        
+        # Per-socket get_peers throttle: socket_id -> (next_allowed, last_peers)
+        self._peers_rate = {}
+        
+        # CLI peers as last seen by the STUN poller: username -> peers-list entry
+        self.known_peers = {}
+        self._poller = None
+        self._poll_failures = 0
+    
+    def start_poller(self):
+        """Fill known_peers once, then keep it fresh from a background greenlet (idempotent)"""
+        if self._poller is not None:
+            return
+        # Set before the first fetch yields, so concurrent callers don't start a second loop
+        self._poller = socketio.start_background_task(self._poll_stun)
+        self._refresh_known_peers()
+    
+    def _poll_stun(self):
+        """Refresh known_peers from STUN forever, so get_peers never waits on HTTP"""
+        while True:
+            socketio.sleep(PEERS_POLL_INTERVAL)
+            self._refresh_known_peers()
+    
+    def _refresh_known_peers(self):
+        """Replace known_peers with a fresh STUN listing; drop it after repeated failures"""
+        error = None
+        try:
+            with self._lock:
+                web_users = set(self.active_users)
+            cli_peers = self._fetch_cli_peers(web_users)
+        except Exception as e:
+            cli_peers, error = None, e
+        
+        if cli_peers is not None:
+            if self._poll_failures:
+                logger.info("STUN peer polling recovered after %d failures", self._poll_failures)
+            self._poll_failures = 0
+            # Swap in a new dict; readers never see a half-updated map
+            self.known_peers = {entry['username']: entry for entry in cli_peers}
+            return
+        
+        # Log once per outage instead of on every poll
+        self._poll_failures += 1
+        if self._poll_failures == 1:
+            logger.error("Error polling STUN peers: %s", error or "unusable response")
+        if self._poll_failures == PEERS_POLL_MAX_FAILURES:
+            logger.warning("STUN unreachable for %d polls, dropping known CLI peers", self._poll_failures)
+            self.known_peers = {}
+        
     def register_user(self, username, port, socket_id):
         """Register a new user in the system"""
-        if username in self.active_users:
-            return False
-        
-        self.active_users[username] = socket_id
-        self.user_peers[username] = []
+        with self._lock:
+            if username in self.active_users:
+                return False
+            
+            self.active_users[username] = socket_id
+            self.sid_to_user[socket_id] = username
+            self.user_peers[username] = set()
+            self.web_peer_entries[username] = web_peer_entry(username)
+            if username in self.known_peers:
+                # Now listed as a web user; swap in a copy, as the poller does
+                self.known_peers = {k: v for k, v in self.known_peers.items() if k != username}
+        self._invalidate_peers_cache()
+        join_room(user_room(username), sid=socket_id)
+        join_room(PRESENCE_ROOM, sid=socket_id)
         
-        # Register with STUN server
+        # Register with STUN server off the request path
+        socketio.start_background_task(self._stun_register, username, port, socket_id)
+        return True
+    
+    def _stun_register(self, username, port, socket_id):
+        """Register a web user with STUN server and report the outcome to its socket"""
+        success = False
         try:
-            response = requests.post(
-                f"{STUN_SERVER_URL}/register",
-                json={
+            response = _stun.request(
+                'POST',
+                _STUN_REGISTER,
+                body=orjson.dumps({
                     "username": username,
                     "ip_address": "web-user",  # Special identifier for web users
                     "port": port
-                },
-                timeout=5
+                }),
+                headers={'Content-Type': 'application/json'},
+                timeout=STUN_TIMEOUT
             )
             
-            if response.status_code == 201:
-                logger.info(f"Web user '{username}' registered with STUN")
-                return True
+            if response.status == 201:
+                logger.info("Web user '%s' registered with STUN", username)
+                success = True
             else:
-                logger.error(f"STUN registration failed: {response.text}")
-                return False
+                logger.error("STUN registration failed: %s", response.data.decode('utf-8', 'replace'))
                 
         except Exception as e:
-            logger.error(f"Error registering with STUN: {e}")
-            return False
+            logger.error("Error registering with STUN: %s", e)
+        
+        # The user may have left (or the name been reused) while STUN answered
+        if self.active_users.get(username) != socket_id:
+            # A departed user's unregister may have beaten this POST; undo the
+            # late entry unless the name now belongs to a new live socket
+            if success and username not in self.active_users:
+                self._stun_unregister(username)
+            return
+        
+        socketio.emit('registration_confirmed', {
+            'success': success,
+            'username': username
+        }, to=socket_id)
+    
+    def _invalidate_peers_cache(self):
+        """Drop cached peer lists after membership changes"""
+        invalidate_cached(_STUN_PEERS, _STUN_PEERS_FULL)
+    
+    def _fetch_peer_info(self, peer):
+        """Get info for a single peer from STUN server (None on failure)"""
+        try:
+            return cached_get(_STUN_PEERINFO + peer, ttl=PEER_INFO_CACHE_TTL)
+        except Exception as e:
+            logger.error("Error getting info for peer %s: %s", peer, e)
+        return None
+    
+    @staticmethod
+    def _cli_peer_entry(username, peer_info):
+        """Build the peers-list entry for a CLI peer"""
+        return {
+            'username': username,
+            'ip_address': peer_info.get('ip_address'),
+            'port': peer_info.get('port'),
+            'type': 'cli'  # CLI peer
+        }
+    
+    def _fetch_cli_peers(self, web_users):
+        """
+        Fetch CLI peers with their info from STUN server
+        Returns: List of peer entries or None on failure
+        """
+        data = cached_get(_STUN_PEERS_FULL)
+        if data is None:
+            # STUN server without a usable bulk endpoint
+            return self._fetch_cli_peers_individually(web_users)
+        
+        # Filter out web users
+        return [
+            self._cli_peer_entry(peer_info['username'], peer_info)
+            for peer_info in data.get('peers', [])
+            if peer_info['username'] not in web_users
+        ]
+    
+    def _fetch_cli_peers_individually(self, web_users):
+        """Fallback for _fetch_cli_peers using /peers plus one /peerinfo call per peer"""
+        data = cached_get(_STUN_PEERS)
+        if data is None:
+            return None
+        
+        # Filter out web users; peers seen by an earlier poll keep their entry
+        known_peers = self.known_peers
+        cli_peers = []
+        candidates = []
+        for peer in data.get('peers', []):
+            if peer in web_users:
+                continue
+            entry = known_peers.get(peer)
+            if entry is not None:
+                cli_peers.append(entry)
+            else:
+                candidates.append(peer)
+        
+        # Fetch info for unseen peers concurrently, giving up on stragglers after the deadline
+        # (_fetch_peer_info swallows per-peer errors, so one bad peer can't abort the batch)
+        try:
+            with gevent.Timeout(PEER_INFO_DEADLINE):
+                infos = self._peer_pool.imap(self._fetch_peer_info, candidates)
+                for peer, peer_info in zip(candidates, infos):
+                    if peer_info:
+                        cli_peers.append(self._cli_peer_entry(peer, peer_info))
+        except gevent.Timeout:
+            logger.warning("Peer info deadline exceeded, returning %d/%d peers", len(cli_peers), len(candidates))
+        return cli_peers
     
     def get_available_peers(self, exclude_user=None):
-        """Get list of all available peers from STUN server"""
+        """Get list of all available peers, built from memory without STUN calls"""
         try:
-            response = requests.get(f"{STUN_SERVER_URL}/peers", timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                peers = data.get('peers', [])
-                
-                # Filter out web users and exclude specific user
-                filtered_peers = []
-                for peer in peers:
-                    if peer != exclude_user and peer not in self.active_users:
-                        # Get peer info
-                        info_response = requests.get(
-                            f"{STUN_SERVER_URL}/peerinfo/{peer}",
-                            timeout=5
-                        )
-                        if info_response.status_code == 200:
-                            peer_info = info_response.json()
-                            filtered_peers.append({
-                                'username': peer,
-                                'ip_address': peer_info.get('ip_address'),
-                                'port': peer_info.get('port'),
-                                'type': 'cli'  # CLI peer
-                            })
-                
-                # Add web users (except excluded)
-                for username, socket_id in self.active_users.items():
-                    if username != exclude_user:
-                        filtered_peers.append({
-                            'username': username,
-                            'ip_address': 'web-interface',
-                            'port': 'N/A',
-                            'type': 'web'  # Web peer
-                        })
-                
-                return filtered_peers
-            return []
+            # Snapshot local state under the lock
+            with self._lock:
+                web_users = set(self.active_users)
+                web_entries = [
+                    entry for username, entry in self.web_peer_entries.items()
+                    if username != exclude_user
+                ]
+            
+            # CLI peers as of the last STUN poll, minus excluded and web users
+            filtered_peers = [
+                entry for username, entry in self.known_peers.items()
+                if username != exclude_user and username not in web_users
+            ]
+            
+            # Add web users, reusing entries built at registration
+            filtered_peers.extend(web_entries)
+            
+            return filtered_peers
         except Exception as e:
-            logger.error(f"Error getting peers: {e}")
+            logger.error("Error getting peers: %s", e)
             return []
     
+    def get_peers_throttled(self, socket_id, exclude_user=None):
+        """get_available_peers limited per socket; repeats the last list when polled too fast"""
+        now = time.monotonic()
+        next_allowed, last_peers = self._peers_rate.get(socket_id, (0.0, None))
+        if now < next_allowed and last_peers is not None:
+            return last_peers
+        
+        peers = self.get_available_peers(exclude_user=exclude_user)
+        self._peers_rate[socket_id] = (now + GET_PEERS_MIN_INTERVAL, peers)
+        return peers
+    
+    def clear_peers_throttle(self, socket_id):
+        """Forget throttle state for a closed socket"""
+        self._peers_rate.pop(socket_id, None)
+    
     def connect_to_peer(self, username, target_username):
         """Connect a web user to another peer"""
-        if username not in self.active_users:
-            return False, "User not registered"
-        
-        # For web-to-web connections, we just track them
-        if target_username in self.active_users:
-            if target_username not in self.user_peers[username]:
-                self.user_peers[username].append(target_username)
-            if username not in self.user_peers[target_username]:
-                self.user_peers[target_username].append(username)
+        with self._lock:
+            if username not in self.active_users:
+                return False, "User not registered"
             
-            # Notify both users
-            socketio.emit('peer_connected', {
-                'peer': target_username,
-                'type': 'web'
-            }, room=self.active_users[username])
+            # Only web-to-web connections exist; CLI peers would need a TCP bridge
+            if target_username not in self.active_users:
+                return False, "CLI connections not yet implemented"
             
-            socketio.emit('peer_connected', {
-                'peer': username,
-                'type': 'web'
-            }, room=self.active_users[target_username])
-            
-            return True, "Connected to web user"
+            # For web-to-web connections, we just track them
+            self.user_peers[username].add(target_username)
+            self.user_peers[target_username].add(username)
+        
+        # One packet to both personal rooms, so the notification is encoded once
+        _emit_local('peer_connected', {
+            'peers': [username, target_username],
+            'type': 'web'
+        }, [user_room(username), user_room(target_username)])
         
-        # For web-to-CLI connections, we need to handle differently
-        # This would require actually connecting via TCP
-        return False, "CLI connections not yet implemented"
+        return True, "Connected to web user"
     
     def disconnect_user(self, username):
         """Remove a user from the system"""
-        if username in self.active_users:
-            socket_id = self.active_users[username]
-            
-            # Notify connected peers
-            for peer in self.user_peers.get(username, []):
-                if peer in self.active_users:
-                    socketio.emit('peer_disconnected', {
-                        'peer': username
-                    }, room=self.active_users[peer])
+        with self._lock:
+            socket_id = self.active_users.pop(username, None)
+            if socket_id is None:
+                return False
             
             # Cleanup
-            if username in self.user_peers:
-                del self.user_peers[username]
-            del self.active_users[username]
-            
-            # Unregister from STUN (optional)
-            try:
-                requests.delete(f"{STUN_SERVER_URL}/unregister/{username}", timeout=2)
-            except:
-                pass
+            self.sid_to_user.pop(socket_id, None)
+            self.web_peer_entries.pop(username, None)
+            peers = [peer for peer in self.user_peers.pop(username, ()) if peer in self.active_users]
             
-            return True
-        return False
+            # Drop the reverse edges so remaining peer sets don't keep stale names
+            for peer in peers:
+                self.user_peers[peer].discard(username)
+        self._invalidate_peers_cache()
+        
+        # Announce the departure with a single presence broadcast; clients
+        # not connected to the user just drop it from their peers list
+        _emit_local('peer_disconnected', {'peer': username}, PRESENCE_ROOM, skip_sid=socket_id)
+        
+        # Unregister from STUN (optional), fire-and-forget
+        socketio.start_background_task(self._stun_unregister, username)
+        
+        return True
+    
+    def _stun_unregister(self, username):
+        """Remove a web user from STUN server; failures are logged, not raised"""
+        try:
+            response = _stun.request('DELETE', _STUN_UNREG + username, timeout=STUN_TIMEOUT)
+        except Exception as e:
+            logger.warning("Error unregistering %s from STUN: %s", username, e)
+            return
+        
+        if response.status not in (200, 404):
+            logger.warning("STUN unregister of %s failed with status %d", username, response.status)
+            return
+        
+        # A poll between disconnect and this DELETE may have cached the old listing
+        self._invalidate_peers_cache()
     
     def send_message(self, from_user, to_user, message):
         """Send message from one user to another"""
@@ -197,42 +497,74 @@ class P2PWebBridge:
         
         # Web-to-web message
         if to_user in self.active_users:
-            socketio.emit('message_received', {
+            _emit_local('message_received', {
                 'from': from_user,
                 'message': message,
                 'timestamp': time.time()
-            }, room=self.active_users[to_user])
+            }, user_room(to_user))
             return True, "Message sent"
         
         # Web-to-CLI message (would need TCP connection)
         return False, "CLI messaging not implemented"
     
     def send_file(self, from_user, to_user, filename, file_data):
-        """Send file from one user to another"""
-        logger.debug(f"Sending file from {from_user} to {to_user}: {filename} ({len(file_data)} bytes base64)")
+        """
+        Send file from one user to another
+        Returns: (success, message, file_id), file_id being None on failure
+        """
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Sending file from %s to %s: %s (%d KiB)", from_user, to_user, filename, len(file_data) >> 10)
         
         if from_user not in self.active_users:
-            logger.error(f"Sender {from_user} not found")
-            return False, "Sender not found"
+            logger.error("Sender %s not found", from_user)
+            return False, "Sender not found", None
         
         # Web-to-web file transfer
         if to_user in self.active_users:
-            file_id = f"file_{int(time.time())}_{filename}"
+            file_id = f"f{_boot}_{next(_file_ctr)}_{filename}"
+            room = user_room(to_user)
             
-            socketio.emit('file_received', {
-                'from': from_user,
-                'filename': filename,
-                'data': file_data,  # base64 encoded
-                'file_id': file_id,
-                'timestamp': time.time(),
-                'size': len(file_data)
-            }, room=self.active_users[to_user])
+            if len(file_data) > FILE_CHUNK_SIZE:
+                self._stream_file(from_user, room, filename, file_data, file_id)
+            else:
+                _emit_local('file_received', {
+                    'from': from_user,
+                    'filename': filename,
+                    'data': file_data,  # raw bytes, sent as a msgpack binary field
+                    'file_id': file_id,
+                    'timestamp': time.time(),
+                    'size': len(file_data)
+                }, room)
             
-            logger.info(f"✅ File sent from {from_user} to {to_user}: {filename}")
-            return True, "File sent"
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("✅ File sent from %s to %s: %s", from_user, to_user, filename)
+            return True, "File sent", file_id
+        
+        logger.warning("Cannot send file to CLI user %s", to_user)
+        return False, "CLI file transfer not implemented", None
+    
+    def _stream_file(self, from_user, room, filename, file_data, file_id):
+        """Emit a large file as file_chunk events plus a closing file_end, yielding between chunks"""
+        view = memoryview(file_data)  # slices share the buffer instead of copying it
+        seq = 0
+        for offset in range(0, len(view), FILE_CHUNK_SIZE):
+            _emit_local('file_chunk', {
+                'file_id': file_id,
+                'seq': seq,
+                'data': view[offset:offset + FILE_CHUNK_SIZE]
+            }, room)
+            seq += 1
+            # Let other greenlets run so one big file can't stall every socket
+            socketio.sleep(0)
         
-        logger.warning(f"Cannot send file to CLI user {to_user}")
-        return False, "CLI file transfer not implemented"
+        _emit_local('file_end', {
+            'from': from_user,
+            'filename': filename,
+            'file_id': file_id,
+            'chunks': seq,
+            'timestamp': time.time(),
+            'size': len(file_data)
+        }, room)
 
 # Initialize bridge
 p2p_bridge = P2PWebBridge()
@@ -245,15 +577,16 @@ def index():
     logger.debug("Serving index.html")
     return render_template('index.html')
 
+# Pre-encoded body for the health check; only the numbers change per request
+_HEALTH_TMPL = b'{"status":"healthy","service":"P2P Web Backend","timestamp":%.3f,"active_users":%d}'
+
 @app.route('/api/health')
 def health():
     """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'service': 'P2P Web Backend',
-        'timestamp': time.time(),
-        'active_users': len(p2p_bridge.active_users)
-    })
+    return Response(
+        _HEALTH_TMPL % (time.time(), len(p2p_bridge.active_users)),
+        mimetype='application/json'
+    )
     
 
 
@@ -271,7 +604,10 @@ def test_connection():
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection"""
-    logger.info(f"✅ WebSocket Client connected: {request.sid}")
+    logger.info("✅ WebSocket Client connected: %s", request.sid)
+    
+    # First connect fills the peer map before this client can ask for it
+    p2p_bridge.start_poller()
     emit('connected', {
         'sid': request.sid,
         'message': 'Connection established'
@@ -286,19 +622,20 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
-    logger.info(f"❌ WebSocket Client disconnected: {request.sid}")
+    logger.info("❌ WebSocket Client disconnected: %s", request.sid)
+    
+    p2p_bridge.clear_peers_throttle(request.sid)
     
     # Find and cleanup user
-    for username, sid in p2p_bridge.active_users.items():
-        if sid == request.sid:
-            p2p_bridge.disconnect_user(username)
-            logger.info(f"Cleaned up user: {username}")
-            break
+    username = p2p_bridge.sid_to_user.get(request.sid)
+    if username:
+        p2p_bridge.disconnect_user(username)
+        logger.info("Cleaned up user: %s", username)
 
 @socketio.on('register')
 def handle_register(data):
     """Handle user registration via WebSocket"""
-    logger.info(f"📝 Registration request received: {data}")
+    logger.info("📝 Registration request received: %s", data)
     username = data.get('username')
     port = data.get('port', 6000)
     
@@ -312,19 +649,26 @@ def handle_register(data):
     
     success = p2p_bridge.register_user(username, port, request.sid)
     
-    logger.info(f"Registration result for {username}: {success}")
+    logger.info("Registration result for %s: %s", username, success)
     emit('registration_result', {
         'success': success,
         'username': username if success else None,
-        'message': 'Registration successful' if success else 'Registration failed'
+        'message': 'Registration successful' if success else 'Registration failed',
+        'pending_stun': success  # STUN outcome follows as registration_confirmed
     })
+    
+    # Announce the new user to everyone else in one broadcast
+    if success:
+        emit('peers_list_delta', {
+            'added': [web_peer_entry(username)]
+        }, broadcast=True, include_self=False)
 
 @socketio.on('get_peers')
 def handle_get_peers(data):
     """Handle request for peers list"""
     username = data.get('username')
-    logger.debug(f"Getting peers for user: {username}")
-    peers = p2p_bridge.get_available_peers(exclude_user=username)
+    logger.debug("Getting peers for user: %s", username)
+    peers = p2p_bridge.get_peers_throttled(request.sid, exclude_user=username)
     
     emit('peers_list', {
         'peers': peers,
@@ -336,7 +680,7 @@ def handle_connect_to_peer(data):
     """Handle connection request to a peer"""
     username = data.get('username')
     target = data.get('target')
-    logger.info(f"Connection request: {username} -> {target}")
+    logger.info("Connection request: %s -> %s", username, target)
     
     success, message = p2p_bridge.connect_to_peer(username, target)
     
@@ -352,7 +696,8 @@ def handle_send_message(data):
     from_user = data.get('from')
     to_user = data.get('to')
     message = data.get('message')
-    logger.info(f"Message from {from_user} to {to_user}: {message[:50]}...")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Message from %s to %s: %.50s...", from_user, to_user, message)
     
     success, msg = p2p_bridge.send_message(from_user, to_user, message)
     
@@ -376,38 +721,38 @@ def handle_send_file(data):
     from_user = data.get('from')
     to_user = data.get('to')
     filename = data.get('filename')
-    file_data = data.get('data')  # base64 encoded
+    file_data = data.get('data')  # raw bytes
     
     if not all([from_user, to_user, filename, file_data]):
-        logger.error(f"Missing parameters in file send: {data}")
+        # Never format the payload itself: it carries the whole file
+        logger.error("Missing parameters in file send (got fields: %s)", sorted(data))
         emit('file_sent', {
             'success': False,
             'message': 'Missing parameters'
         })
         return
     
-    logger.info(f"📁 File from {from_user} to {to_user}: {filename} ({len(file_data) if file_data else 0} bytes)")
-    
-    success, msg = p2p_bridge.send_file(from_user, to_user, filename, file_data)
+    success, msg, file_id = p2p_bridge.send_file(from_user, to_user, filename, file_data)
     
     emit('file_sent', {
         'success': success,
         'message': msg,
         'to': to_user,
         'filename': filename,
-        'file_id': f"file_{int(time.time())}_{filename}"
+        'file_id': file_id
     })
     
 
 
 if __name__ == '__main__':
     logger.info("🚀 Starting P2P Web Backend with enhanced logging...")
-    logger.info(f"STUN Server URL: {STUN_SERVER_URL}")
+    logger.info("STUN Server URL: %s", STUN_SERVER_URL)
     
     socketio.run(
         app, 
         host='0.0.0.0', 
         port=8080, 
-        debug=True,  
-        log_output=True
+        debug=DEBUG,
+        use_reloader=False,  # no second process or file-stat loop beside the hub
+        log_output=DEBUG  # per-request access log only while debugging
     )
\ No newline at end of file
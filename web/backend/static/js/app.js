@@ -17,6 +17,7 @@ class P2PWebApp {
         this.connectionAttempts = 0;
         this.maxConnectionAttempts = 5;
         this.messageClass = null
+        this.incomingFiles = {};  // file_id -> received chunks, for streamed files
         
         this.init();
     }
@@ -83,7 +84,7 @@ class P2PWebApp {
         this.log(`Attempting WebSocket connection (attempt ${this.connectionAttempts})...`, 'info');
         
         this.socket = io(wsUrl2, {
-            transports: ['websocket', 'polling'],
+            transports: ['websocket'],
             reconnection: true,
             reconnectionAttempts: 10,
             reconnectionDelay: 1000,
@@ -117,6 +118,8 @@ class P2PWebApp {
         });
         
         this.socket.on('disconnect', (reason) => {
+            // Streamed files cut off mid-transfer will never get their file_end
+            this.incomingFiles = {};
             this.log(`❌ Disconnected from server: ${reason}`, 'error');
             this.updateConnectionStatus(false);
             this.showAlert('Disconnected', 'Lost connection to server', 'warning');
@@ -138,10 +141,18 @@ class P2PWebApp {
             this.handleRegistrationResult(data);
         });
         
+        this.socket.on('registration_confirmed', (data) => {
+            this.handleRegistrationConfirmed(data);
+        });
+        
         this.socket.on('peers_list', (data) => {
             this.handlePeersList(data);
         });
         
+        this.socket.on('peers_list_delta', (data) => {
+            this.handlePeersListDelta(data);
+        });
+        
         this.socket.on('connection_result', (data) => {
             this.handleConnectionResult(data);
         });
@@ -166,6 +177,14 @@ class P2PWebApp {
             this.handleFileReceived(data);
         });
 
+        this.socket.on('file_chunk', (data) => {
+            this.handleFileChunk(data);
+        });
+
+        this.socket.on('file_end', (data) => {
+            this.handleFileEnd(data);
+        });
+
         this.socket.on('file_sent', (data) => {
             this.handleFileSent(data);
         });
@@ -270,6 +289,14 @@ class P2PWebApp {
         }
     }
     
+    handleRegistrationConfirmed(data) {
+        if (data.success) {
+            this.log(`${data.username} registered with STUN server`, 'success');
+        } else {
+            this.log('STUN registration failed; CLI peers will not see you', 'warning');
+        }
+    }
+    
     disconnect() {
         if (!this.connected) return;
         
@@ -320,6 +347,19 @@ class P2PWebApp {
         this.updateOnlinePeersCount();
     }
     
+    handlePeersListDelta(data) {
+        if (!this.connected) return;
+        
+        (data.added || []).forEach((peer) => {
+            if (peer.username !== this.username &&
+                !this.availablePeers.some((p) => p.username === peer.username)) {
+                this.availablePeers.push(peer);
+            }
+        });
+        this.renderPeersList();
+        this.updateOnlinePeersCount();
+    }
+    
     connectToPeer(peerUsername) {
         if (!this.connected || !this.username) return;
         
@@ -352,22 +392,32 @@ class P2PWebApp {
     }
     
     handlePeerConnected(data) {
-        if (!this.connectedPeers.includes(data.peer)) {
-            this.connectedPeers.push(data.peer);
+        // Both sides receive the same payload; the peer is the other name
+        const peer = data.peers.find((name) => name !== this.username);
+        if (!peer) return;
+        
+        if (!this.connectedPeers.includes(peer)) {
+            this.connectedPeers.push(peer);
         }
         
         this.updateChatDropdown();
         this.renderConnectedPeers();
         this.updateOnlinePeersCount();
         
-        this.log(`${data.peer} connected to you`, 'success');
+        this.log(`${peer} connected to you`, 'success');
     }
     
     handlePeerDisconnected(data) {
+        // Broadcast to every user; forget the peer wherever it is listed
+        this.availablePeers = this.availablePeers.filter((p) => p.username !== data.peer);
+        this.renderPeersList();
+        
         const index = this.connectedPeers.indexOf(data.peer);
-        if (index > -1) {
-            this.connectedPeers.splice(index, 1);
+        if (index === -1) {
+            this.updateOnlinePeersCount();
+            return;
         }
+        this.connectedPeers.splice(index, 1);
         
         // If current chat peer disconnected, clear chat
         if (this.currentChatPeer === data.peer) {
@@ -457,13 +507,12 @@ class P2PWebApp {
         const reader = new FileReader();
         
         reader.onload = (e) => {
-            const base64Data = e.target.result.split(',')[1];
-            
+            // Raw bytes travel as a msgpack binary field, no base64 inflation
             this.socket.emit('send_file', {
                 from: this.username,
                 to: this.currentChatPeer,
                 filename: file.name,
-                data: base64Data
+                data: e.target.result
             });
             
             this.fileCount++;
@@ -473,7 +522,7 @@ class P2PWebApp {
             this.showAlert('Sending', `Sending ${file.name}...`, 'info');
         };
         
-        reader.readAsDataURL(file);
+        reader.readAsArrayBuffer(file);
         $('#file-input').val('');
     }
     
@@ -804,10 +853,34 @@ class P2PWebApp {
 
 
 
+    handleFileChunk(data) {
+        const chunks = this.incomingFiles[data.file_id] || (this.incomingFiles[data.file_id] = []);
+        chunks[data.seq] = data.data;
+    }
+    
+    handleFileEnd(data) {
+        const chunks = this.incomingFiles[data.file_id] || [];
+        delete this.incomingFiles[data.file_id];
+        
+        // Array.every skips holes, so check each index explicitly
+        let complete = chunks.length === data.chunks;
+        for (let i = 0; complete && i < chunks.length; i++) {
+            complete = chunks[i] !== undefined;
+        }
+        if (!complete) {
+            this.log(`❌ Incomplete file from ${data.from}: ${data.filename}`, 'error');
+            return;
+        }
+        
+        // Blob concatenates the chunks in order without an intermediate copy
+        this.handleFileReceived({ ...data, data: new Blob(chunks) });
+    }
+    
     handleFileReceived(data) {
     this.log(`📥 File received from ${data.from}: ${data.filename} (${this.formatBytes(data.size)})`, 'success');
     
-    this.addFileMessage(data.from, data.filename, data.data);
+    const fileUrl = URL.createObjectURL(new Blob([data.data]));
+    this.addFileMessage(data.from, data.filename, fileUrl);
     
     this.showAlert('File Received', `${data.filename} from ${data.from}`, 'success');
 }
@@ -823,7 +896,7 @@ handleFileSent(data) {
     }
 }
 
-addFileMessage(sender, filename, base64Data) {
+addFileMessage(sender, filename, fileUrl) {
     const $chat = $('#chat-messages');
     const timestamp = new Date().toLocaleTimeString();
     const avatarLetter = sender.charAt(0).toUpperCase();
@@ -837,11 +910,11 @@ addFileMessage(sender, filename, base64Data) {
     if (isImage) {
         fileContent = `
             <div class="file-preview">
-                <img src="data:image/jpeg;base64,${base64Data}" 
+                <img src="${fileUrl}" 
                      alt="${filename}" 
                      class="img-thumbnail" 
                      style="max-width: 200px; max-height: 200px; cursor: pointer;"
-                     onclick="window.p2pApp.downloadFile('${filename}', '${base64Data}')">
+                     onclick="window.p2pApp.downloadFile('${filename}', '${fileUrl}')">
                 <div class="file-info mt-1">
                     <small class="text-muted">${filename}</small>
                 </div>
@@ -855,7 +928,7 @@ addFileMessage(sender, filename, base64Data) {
                     <small class="text-muted">${filename}</small>
                     <br>
                     <button class="btn btn-sm btn-danger mt-1" 
-                            onclick="window.p2pApp.downloadFile('${filename}', '${base64Data}')">
+                            onclick="window.p2pApp.downloadFile('${filename}', '${fileUrl}')">
                         <i class="fas fa-download me-1"></i>Download PDF
                     </button>
                 </div>
@@ -869,12 +942,12 @@ addFileMessage(sender, filename, base64Data) {
                     <small class="text-muted">${filename}</small>
                     <br>
                     <button class="btn btn-sm btn-outline-secondary mt-1" 
-                            onclick="window.p2pApp.downloadFile('${filename}', '${base64Data}')">
+                            onclick="window.p2pApp.downloadFile('${filename}', '${fileUrl}')">
                         <i class="fas fa-download me-1"></i>Download
                     </button>
                     ${isText ? `
                     <button class="btn btn-sm btn-outline-info mt-1" 
-                            onclick="window.p2pApp.previewTextFile('${filename}', '${base64Data}')">
+                            onclick="window.p2pApp.previewTextFile('${filename}', '${fileUrl}')">
                         <i class="fas fa-eye me-1"></i>Preview
                     </button>
                     ` : ''}
@@ -917,9 +990,9 @@ formatBytes(bytes, decimals = 2) {
     return parseFloat((bytes / Math.pow(k, i)).toFixed(dm)) + ' ' + sizes[i];
 }
 
-downloadFile(filename, base64Data) {
+downloadFile(filename, fileUrl) {
     const link = document.createElement('a');
-    link.href = 'data:application/octet-stream;base64,' + base64Data;
+    link.href = fileUrl;
     link.download = filename;
     document.body.appendChild(link);
     link.click();
@@ -928,19 +1001,21 @@ downloadFile(filename, base64Data) {
     this.log(`File downloaded: ${filename}`, 'success');
 }
 
-previewTextFile(filename, base64Data) {
-    try {
-        const text = atob(base64Data);
-        Swal.fire({
-            title: `Preview: ${filename}`,
-            html: `<pre style="text-align: left; max-height: 400px; overflow-y: auto;">${this.escapeHtml(text)}</pre>`,
-            width: '80%',
-            showCloseButton: true,
-            showConfirmButton: false
+previewTextFile(filename, fileUrl) {
+    fetch(fileUrl)
+        .then((response) => response.text())
+        .then((text) => {
+            Swal.fire({
+                title: `Preview: ${filename}`,
+                html: `<pre style="text-align: left; max-height: 400px; overflow-y: auto;">${this.escapeHtml(text)}</pre>`,
+                width: '80%',
+                showCloseButton: true,
+                showConfirmButton: false
+            });
+        })
+        .catch(() => {
+            this.showAlert('Error', 'Cannot preview this file', 'error');
         });
-    } catch (e) {
-        this.showAlert('Error', 'Cannot preview this file', 'error');
-    }
 }
 }
 